@@ -340,6 +340,24 @@ async def get_bot_status(
     )
 
 
+@router.get("/{gewe_app_id}/queue", summary="获取机器人消息队列状态")
+async def get_bot_queue_status(
+    gewe_app_id: str,
+    current_user: dict = Depends(get_current_active_user),
+):
+    """获取机器人消息队列状态
+
+    包括发送消息队列的状态，以及接收消息的后台任务并发限制统计(message_limiter)：
+    执行中和排队的任务数、丢弃次数和排队耗时
+    """
+    queue_status = await BotClientManager().get_bot_queue_status(gewe_app_id)
+    if "error" in queue_status and "queue_size" not in queue_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=queue_status["error"]
+        )
+    return queue_status
+
+
 @router.get(
     "/{gewe_app_id}/contacts",
     response_model=List[ContactResponse],
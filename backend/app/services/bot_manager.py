@@ -4,14 +4,15 @@
 管理GeweClient实例，处理插件加载和消息分发
 """
 
+import json
 import sys
-import importlib.util
 from typing import Dict, Optional, List, Any
 from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from opengewe.client import GeweClient
-from opengewe.utils.plugin_base import PluginBase
+from opengewe.utils.plugin_manifest import get_plugin_manifest
+from opengewe.utils.plugin_watcher import get_plugin_watcher
 from ..models.admin import GlobalPlugin
 from ..models.bot import BotInfo, BotPlugin
 from ..core.session_manager import admin_session
@@ -91,6 +92,28 @@ class BotClientManager:
             **queue_options,
         )
 
+        # 限制消息回调和插件处理的后台任务并发量
+        try:
+            client.message_factory.configure_limiter(
+                max_in_flight=queue_config.get("max_inflight_messages"),
+                max_pending=queue_config.get("max_pending_messages"),
+                overflow_policy=queue_config.get("overflow_policy"),
+                ordered=queue_config.get("ordered_by_conversation"),
+            )
+        except (TypeError, ValueError) as e:
+            logger.error(f"消息并发限制配置无效，使用默认值: {e}")
+
+        # 丢弃Gewe在回调超时后重新投递的重复回调
+        try:
+            dedup_window = float(queue_config.get("dedup_window") or 0)
+            if dedup_window > 0:
+                client.message_factory.enable_deduplication(
+                    max_size=int(queue_config.get("dedup_size") or 10000),
+                    ttl=dedup_window,
+                )
+        except (TypeError, ValueError) as e:
+            logger.error(f"回调去重配置无效，不启用去重: {e}")
+
         # 加载插件
         await self._load_plugins_for_bot(client, bot, session)
 
@@ -145,62 +168,56 @@ class BotClientManager:
             ".venv",
         }
 
-        # 遍历插件目录
-        for plugin_folder in plugins_dir.iterdir():
-            if not plugin_folder.is_dir() or plugin_folder.name.startswith("."):
-                continue
+        # 插件模块以 plugins.<目录名>.main 导入，与各机器人的插件管理器和热重载共用
+        # 同一个模块对象；plugins目录本身也在搜索路径中，确保插件能正确导入utils
+        for path in (str(project_root), str(plugins_dir)):
+            if path not in sys.path:
+                sys.path.insert(0, path)
 
+        manifest = get_plugin_manifest(str(plugins_dir))
+
+        # 遍历插件目录
+        for dirname in manifest.scan():
             # 排除非插件目录
-            if plugin_folder.name in excluded_dirs:
-                logger.debug(f"跳过非插件目录: {plugin_folder.name}")
+            if dirname in excluded_dirs:
+                logger.debug(f"跳过非插件目录: {dirname}")
                 continue
 
-            # 检查是否有main.py文件
-            main_file = plugin_folder / "main.py"
-            if not main_file.exists():
-                logger.debug(f"插件目录缺少main.py: {plugin_folder.name}")
+            try:
+                # 模块在进程内只导入一次，源码未变化时直接返回已导入的插件类
+                plugin_classes = manifest.plugin_classes(dirname)
+            except Exception as e:
+                logger.error(f"加载插件失败: {dirname}, 错误: {e}", exc_info=True)
                 continue
 
-            try:
-                # 动态导入插件模块
-                spec = importlib.util.spec_from_file_location(
-                    f"plugins.{plugin_folder.name}.main", main_file
-                )
-                if spec and spec.loader:
-                    module = importlib.util.module_from_spec(spec)
-
-                    # 添加plugins目录到sys.path，确保插件能正确导入utils
-                    if str(plugins_dir) not in sys.path:
-                        sys.path.insert(0, str(plugins_dir))
-
-                    spec.loader.exec_module(module)
-
-                    # 查找PluginBase的子类
-                    for attr_name in dir(module):
-                        attr = getattr(module, attr_name)
-                        if (
-                            isinstance(attr, type)
-                            and issubclass(attr, PluginBase)
-                            and attr != PluginBase
-                        ):
-                            self._available_plugins[plugin_folder.name] = attr
-                            logger.info(
-                                f"加载插件: {plugin_folder.name} ({attr.__name__})"
-                            )
-                            break
-                    else:
-                        logger.warning(
-                            f"插件目录中未找到PluginBase子类: {plugin_folder.name}"
-                        )
+            if not plugin_classes:
+                logger.warning(f"插件目录中未找到PluginBase子类: {dirname}")
+                continue
 
-            except Exception as e:
-                logger.error(
-                    f"加载插件失败: {plugin_folder.name}, 错误: {e}", exc_info=True
-                )
+            plugin_class = plugin_classes[0]
+            if self._available_plugins.get(dirname) is not plugin_class:
+                logger.info(f"加载插件: {dirname} ({plugin_class.__name__})")
+            self._available_plugins[dirname] = plugin_class
 
+        manifest.save()
         self._plugins_loaded = True
         logger.info(f"插件加载完成，可用插件数量: {len(self._available_plugins)}")
 
+    @staticmethod
+    def _parse_plugin_config(config_json: Optional[str], plugin_name: str) -> Dict:
+        """解析数据库中保存的插件JSON配置，配置为空或格式无效时返回空字典"""
+        if not config_json:
+            return {}
+        try:
+            config = json.loads(config_json)
+        except ValueError as e:
+            logger.warning(f"插件 {plugin_name} 的配置不是有效的JSON: {e}")
+            return {}
+        if not isinstance(config, dict):
+            logger.warning(f"插件 {plugin_name} 的配置不是JSON对象，已忽略")
+            return {}
+        return config
+
     async def _load_plugins_for_bot(
         self, client: GeweClient, bot: BotInfo, session: AsyncSession
     ):
@@ -237,29 +254,24 @@ class BotClientManager:
             f"机器人 {bot.gewe_app_id} 启用的插件: {list(bot_plugins.keys())}")
 
         loaded_count = 0
+        plugin_classes = []
+        # {插件类名: 配置}，机器人的插件配置覆盖全局插件配置中的同名项
+        plugin_configs: Dict[str, Dict[str, Any]] = {}
 
-        # 为每个启用的插件创建实例
+        # 收集启用的插件类，插件类由所有机器人共用，每个机器人创建各自的插件实例
         for plugin_name in bot_plugins.keys():
             if plugin_name in self._available_plugins and plugin_name in global_plugins:
-                try:
-                    plugin_cls = self._available_plugins[plugin_name]
-                    logger.info(
-                        f"正在为机器人 {bot.gewe_app_id} 注册插件: {plugin_name}"
-                    )
-
-                    # 注册插件到客户端
-                    await client.plugin_manager.register_plugin(plugin_cls)
-                    loaded_count += 1
-
-                    logger.info(
-                        f"为机器人 {bot.gewe_app_id} 成功加载插件: {plugin_name}"
-                    )
-
-                except Exception as e:
-                    logger.error(
-                        f"为机器人 {bot.gewe_app_id} 加载插件 {plugin_name} 失败: {e}",
-                        exc_info=True,
-                    )
+                plugin_class = self._available_plugins[plugin_name]
+                plugin_classes.append(plugin_class)
+                plugin_configs[plugin_class.__name__] = {
+                    **self._parse_plugin_config(
+                        global_plugins[plugin_name].global_config_json, plugin_name
+                    ),
+                    **self._parse_plugin_config(
+                        bot_plugins[plugin_name].config_json, plugin_name
+                    ),
+                }
+                logger.info(f"正在为机器人 {bot.gewe_app_id} 注册插件: {plugin_name}")
             else:
                 missing_conditions = []
                 if plugin_name not in self._available_plugins:
@@ -271,6 +283,22 @@ class BotClientManager:
                     f"跳过插件 {plugin_name} for 机器人 {bot.gewe_app_id}: {', '.join(missing_conditions)}"
                 )
 
+        # 注册插件到客户端，互不依赖的插件并行初始化
+        try:
+            loaded = await client.plugin_manager.load_plugin_classes(
+                plugin_classes, plugin_configs
+            )
+            loaded_count = len(loaded)
+            if loaded:
+                logger.info(
+                    f"为机器人 {bot.gewe_app_id} 成功加载插件: {', '.join(loaded)}"
+                )
+        except Exception as e:
+            logger.error(
+                f"为机器人 {bot.gewe_app_id} 加载插件失败: {e}",
+                exc_info=True,
+            )
+
         logger.info(
             f"机器人 {bot.gewe_app_id} 插件加载完成，已加载 {loaded_count} 个插件"
         )
@@ -297,44 +325,8 @@ class BotClientManager:
 
             # 检查事件管理器的handlers属性
             event_manager = plugin_manager.event_manager
-            if not hasattr(event_manager.__class__, "_handlers"):
-                logger.error("事件管理器缺少_handlers类属性，这不应该发生")
-
-                # 方式6: 尝试重新注册插件的事件处理器
-                try:
-                    for plugin_name, plugin_instance in plugin_manager.plugins.items():
-                        logger.debug(f"尝试为插件 {plugin_name} 重新注册事件处理器")
-
-                        # 检查插件是否有消息处理方法
-                        for method_name in dir(plugin_instance):
-                            if method_name.startswith("handle_"):
-                                method = getattr(plugin_instance, method_name)
-                                if callable(method):
-                                    logger.debug(
-                                        f"发现插件方法: {plugin_name}.{method_name}"
-                                    )
-
-                                    # 尝试手动注册到事件管理器
-                                    if method_name == "handle_text":
-                                        try:
-                                            from opengewe.callback.types import (
-                                                MessageType,
-                                            )
-
-                                            if hasattr(event_manager, "handlers"):
-                                                event_manager.handlers[
-                                                    MessageType.TEXT
-                                                ].append(method)
-                                                logger.debug(
-                                                    f"已手动注册文本消息处理器: {plugin_name}.{method_name}"
-                                                )
-                                        except Exception as e:
-                                            logger.error(
-                                                f"手动注册文本消息处理器失败: {e}"
-                                            )
-
-                except Exception as e:
-                    logger.error(f"重新注册插件事件处理器失败: {e}")
+            if not hasattr(event_manager, "handlers"):
+                logger.error("事件管理器缺少handlers属性，这不应该发生")
 
             # 检查插件是否正确注册了事件处理器
             if hasattr(plugin_manager, "event_manager") and hasattr(
@@ -421,6 +413,20 @@ class BotClientManager:
                     if bot:
                         await self._load_plugins_for_bot(client, bot, session)
 
+    async def reload_changed_plugins(self) -> List[str]:
+        """只重新加载源码发生变化的插件
+
+        所有机器人中使用这些插件的实例会被替换，其他插件和机器人不受影响
+
+        Returns:
+            List[str]: 被替换的插件名称列表
+        """
+        reloaded = await get_plugin_watcher().check()
+        if reloaded:
+            # 下次扫描时重新导入源码变化的插件，未变化的插件直接复用
+            self._plugins_loaded = False
+        return reloaded
+
     async def get_bot_plugin_status(self, gewe_app_id: str) -> Dict[str, Any]:
         """获取机器人的插件状态"""
         client = await self.get_client(gewe_app_id)
@@ -449,12 +455,19 @@ class BotClientManager:
                 event_manager = client.plugin_manager.event_manager
                 if hasattr(event_manager, "handlers"):
                     for event_type, handlers in event_manager.handlers.items():
-                        event_handlers_info[event_type] = len(handlers)
+                        event_handlers_info[event_type.name] = len(handlers)
 
             plugin_status = {
                 "available_plugins": list(self._available_plugins.keys()),
                 "plugin_manager_info": plugin_manager_info,
                 "event_handlers_info": event_handlers_info,
+                "plugin_stats": client.plugin_manager.get_plugin_stats(),
+                "handler_stats": client.plugin_manager.get_handler_stats(),
+                "slow_handlers": client.plugin_manager.get_slow_handlers(),
+                "loop_stalls": client.plugin_manager.get_loop_stalls(),
+                "plugin_processes": client.plugin_manager.get_process_pool_status(),
+                "lazy_plugins": client.plugin_manager.get_lazy_plugins(),
+                "message_limiter": client.message_factory.get_limiter_stats(),
                 "client_info": {
                     "has_plugin_manager": hasattr(client, "plugin_manager"),
                     "has_message_factory": hasattr(client, "message_factory"),
@@ -470,6 +483,18 @@ class BotClientManager:
             logger.error(f"获取插件状态失败: {e}", exc_info=True)
             return {"error": str(e)}
 
+    async def get_bot_queue_status(self, gewe_app_id: str) -> Dict[str, Any]:
+        """获取机器人的消息队列状态，包括接收消息的后台任务并发限制统计"""
+        client = await self.get_client(gewe_app_id)
+        if not client:
+            return {"error": "机器人客户端不存在"}
+
+        try:
+            return await client.get_queue_status()
+        except Exception as e:
+            logger.error(f"获取消息队列状态失败: {e}", exc_info=True)
+            return {"error": str(e)}
+
     def get_available_plugins(self) -> List[str]:
         """获取所有可用插件列表"""
         return list(self._available_plugins.keys())
@@ -12,8 +12,10 @@ logger = get_logger(__name__)
 
 try:
     from opengewe.utils.decorators import scheduler
+    from opengewe.utils.stats import get_scheduler_stats
 except ImportError:
     scheduler = None
+    get_scheduler_stats = None
     logger.warning("无法导入opengewe调度器，调度器管理功能将受限")
 
 
@@ -59,7 +61,12 @@ class SchedulerManager:
         return scheduler.running
 
     def get_scheduler_status(self) -> Dict[str, Any]:
-        """获取调度器状态信息"""
+        """获取调度器状态信息
+
+        metrics 中是各定时任务的执行统计：开始执行的延迟(lag，实际开始时间减计划时间)
+        和执行耗时(duration)分布，以及因超过允许延迟(missed)、上一次执行未结束(overlaps)
+        和由其他实例执行(lock_skipped)而跳过的次数
+        """
         if scheduler is None:
             return {"available": False, "running": False, "error": "调度器不可用"}
 
@@ -86,6 +93,7 @@ class SchedulerManager:
                 "timezone": str(scheduler.timezone),
                 "total_jobs": len(all_jobs),
                 "jobs": jobs_info,
+                "metrics": get_scheduler_stats().to_dict(),
             }
         except Exception as e:
             return {"available": True, "running": False, "error": str(e)}
@@ -114,6 +114,15 @@ async def lifespan(app: FastAPI):
             logger.error(f"配置系统初始化失败: {e}", exc_info=True)
             logger.warning("将继续使用文件配置系统")
 
+        # 应用所有机器人共用的进程级配置（线程池、工作进程、定时任务选项），只应用一次
+        try:
+            from app.services.initializers.config_initializer import config_initializer
+            from opengewe.utils.plugin_manager import configure_process
+
+            configure_process(config_initializer.load_toml_config())
+        except Exception as e:
+            logger.error(f"进程级配置应用失败: {e}", exc_info=True)
+
         # 初始化机器人配置（从配置文件）
         try:
             from app.services.initializers.bot_initializer import (